@@ -1,67 +1,120 @@
 import asyncio
 import websockets
-import base64
-import json
+import orjson
 import numpy as np
 import sounddevice as sd
-import soundfile as sf
-import tempfile
-import playsound
+
+try:
+    import uvloop
+except ImportError:  # uvloop doesn't support Windows
+    uvloop = None
 
 WS_URL = "ws://localhost:8765/ws/agent"
 SAMPLE_RATE = 16000
 CHANNELS = 1
+BLOCKSIZE = 4800  # 300 ms per callback and per websocket frame
+
+# End-of-utterance detection: blocks quieter than SILENCE_RMS are silence, and
+# this many in a row after speech close the utterance with FRAME_AUDIO_DONE
+SILENCE_RMS = 0.01
+SILENCE_BLOCKS = 3  # 900 ms
+
+# Binary frame tags (first byte of every binary websocket message)
+FRAME_AUDIO_CHUNK = b"\x01"
+FRAME_AUDIO_DONE = b"\x02"
+FRAME_TTS_AUDIO = b"\x03"
 
 
-def float_to_pcm16(arr):
-    return (np.clip(arr, -1, 1) * 32767).astype(np.int16)
+def float_to_pcm16(arr, scratch, out):
+    """Convert float samples into the int16 array ``out`` without temporaries."""
+    np.clip(arr, -1.0, 1.0, out=scratch)
+    np.multiply(scratch, 32767.0, out=scratch)
+    np.rint(scratch, out=scratch)
+    np.copyto(out, scratch, casting="unsafe")
 
 
 async def mic_sender(ws):
     q = asyncio.Queue()
     loop = asyncio.get_running_loop()
+    scratch = np.empty(BLOCKSIZE, dtype=np.float32)
 
     def callback(indata, frames, time, status):
-        pcm = float_to_pcm16(indata[:, 0])
-        raw = pcm.tobytes()
-        loop.call_soon_threadsafe(q.put_nowait, raw)
+        # Build the tagged frame in place: the int16 samples are written
+        # straight into the bytes that get sent.
+        frame = bytearray(len(FRAME_AUDIO_CHUNK) + frames * 2)
+        frame[0:1] = FRAME_AUDIO_CHUNK
+        pcm = np.frombuffer(frame, dtype=np.int16, offset=len(FRAME_AUDIO_CHUNK))
+        samples = indata[:, 0]
+        float_to_pcm16(samples, scratch[:frames], pcm)
+        level = float(np.sqrt(np.dot(samples, samples) / frames)) if frames else 0.0
+        loop.call_soon_threadsafe(q.put_nowait, (frame, level))
 
     stream = sd.InputStream(
         samplerate=SAMPLE_RATE,
         channels=CHANNELS,
         dtype="float32",
-        blocksize=1600,
+        blocksize=BLOCKSIZE,
         callback=callback,
     )
 
+    # Leading silence isn't sent; trailing silence is, until the utterance ends
+    speaking = False
+    silent_blocks = 0
+
     with stream:
         while True:
-            raw = await q.get()
-            b64 = base64.b64encode(raw).decode("ascii")
-            await ws.send(json.dumps({"type": "audio_chunk", "data": b64}))
+            frame, level = await q.get()
+
+            if level >= SILENCE_RMS:
+                speaking = True
+                silent_blocks = 0
+            elif not speaking:
+                continue
+            else:
+                silent_blocks += 1
+
+            await ws.send(frame)
+
+            if speaking and silent_blocks >= SILENCE_BLOCKS:
+                # The server finalizes the transcript and answers on this frame
+                await ws.send(FRAME_AUDIO_DONE)
+                speaking = False
+                silent_blocks = 0
 
 
 async def speaker_player(ws):
-    buffer = []
+    loop = asyncio.get_running_loop()
+    out = None
+
+    try:
+        while True:
+            msg = await ws.recv()
+
+            # Binary frames carry raw PCM16 for the clip announced by audio_start
+            if isinstance(msg, bytes):
+                if msg[:1] == FRAME_TTS_AUDIO and out is not None:
+                    # write() blocks until PortAudio has room, so keep it off the loop
+                    await loop.run_in_executor(None, out.write, memoryview(msg)[1:])
+                continue
 
-    while True:
-        msg = await ws.recv()
-        data = json.loads(msg)
-        typ = data.get("type")
+            data = orjson.loads(msg)
+            typ = data.get("type")
 
-        if typ == "bot_text":
-            print("Bot:", data["text"])
+            if typ == "bot_text":
+                print("Bot:", data["text"])
 
-        elif typ == "audio_chunk":
-            buffer.append(base64.b64decode(data["data"]))
+            elif typ == "audio_start":
+                sr, channels = data["sr"], data.get("channels", CHANNELS)
 
-        elif typ == "audio_done":
-            wav = b"".join(buffer)
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-            tmp.write(wav)
-            tmp.close()
-            playsound.playsound(tmp.name)
-            buffer = []
+                # Keep one stream open; only reopen if the format changes
+                if out is None or out.samplerate != sr or out.channels != channels:
+                    if out is not None:
+                        out.close()
+                    out = sd.RawOutputStream(samplerate=sr, channels=channels, dtype="int16")
+                    out.start()
+    finally:
+        if out is not None:
+            out.close()
 
 
 async def main():
@@ -72,4 +125,6 @@ async def main():
 
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main())
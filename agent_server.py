@@ -1,8 +1,17 @@
 import os
 import asyncio
 import json
-import base64
+import orjson
+import io
+import re
+import hashlib
 import tempfile
+import threading
+import wave
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, fields
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Literal, Dict
 
@@ -52,6 +61,7 @@ gcp_credentials = service_account.Credentials.from_service_account_file(cred_pat
 speech_client = speech.SpeechClient(credentials=gcp_credentials)
 SAMPLE_RATE = 16000
 LANGUAGE = "en-US"
+STT_CHUNK_BYTES = SAMPLE_RATE // 10 * 2  # 100 ms of mono PCM16
 
 class FlossyAIResponse(BaseModel):
     intent: Literal["book_appointment", "cancel_appointment", "symptom", "smalltalk"]
@@ -65,6 +75,29 @@ class FlossyAIResponse(BaseModel):
     ready_for_cancellation: bool = False
 
 
+@dataclass(slots=True)
+class ConnState:
+    """Booking details collected so far in one conversation."""
+    name: Optional[str] = None
+    date: Optional[str] = None
+    time: Optional[str] = None
+    phone: Optional[str] = None
+    symptom_message: Optional[str] = None
+
+    def merge(self, ai: dict):
+        """Copy every non-empty state field from a Gemini reply."""
+        for k in _STATE_FIELDS:
+            v = ai.get(k)
+            if v:
+                setattr(self, k, v)
+
+    def is_empty(self) -> bool:
+        return not any(getattr(self, k) for k in _STATE_FIELDS)
+
+
+_STATE_FIELDS = tuple(f.name for f in fields(ConnState))
+
+
 # --------------------------------------------
 # CONFIG
 # --------------------------------------------
@@ -78,18 +111,68 @@ BUSINESS_END_HOUR = 17
 SLOT_DURATION_MINUTES = 30
 DEFAULT_DOCTOR_NAME = "Dr. Ava Sharma"
 
+GREETING_MESSAGE = "Hello! I'm FlossyAI. How can I assist you today?"
+FALLBACK_MESSAGE = "I couldn’t understand that, could you repeat?"
+TEXT_FALLBACK_MESSAGE = "Sorry, I couldn’t understand that."
+
+# Binary frame tags (first byte of every binary websocket message)
+FRAME_AUDIO_CHUNK = 0x01
+FRAME_AUDIO_DONE = 0x02
+FRAME_TTS_AUDIO = 0x03
+
+TTS_RATE = 150
+TTS_VOICE_HINT = "female"
+TTS_CACHE_SIZE = 512
+
 app = FastAPI(title="FlossyAI Voice Agent")
 
-voice_states = {}
-text_states = {}
+voice_states: Dict[int, ConnState] = {}
+text_states: Dict[str, ConnState] = {}
+
+# Short blocking calls (pyttsx3 TTS, SQLAlchemy) run here, off the event loop
+io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="flossy-io")
+
+# A streaming recognize call holds its thread for the whole utterance while it
+# waits on audio, so STT streams get their own pool and can't starve io_pool
+STT_MAX_STREAMS = 64
+stt_pool = ThreadPoolExecutor(max_workers=STT_MAX_STREAMS, thread_name_prefix="flossy-stt")
+
+
+async def run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_pool, fn, *args)
+
+
+async def run_io_to_completion(fn, *args):
+    """run_io for writes that must not be abandoned half-way by a cancel.
+
+    The worker thread finishes the call regardless, so rather than returning
+    early the caller keeps waiting for it. Returns ``(result, cancelled)``;
+    when ``cancelled`` is True the caller should re-raise CancelledError once
+    it has acted on the result.
+    """
+    fut = asyncio.ensure_future(run_io(fn, *args))
+    cancelled = False
+    while True:
+        try:
+            return await asyncio.shield(fut), cancelled
+        except asyncio.CancelledError:
+            if fut.cancelled():
+                raise
+            cancelled = True
 
 
 # --------------------------------------------
 # GOOGLE SPEECH RECOGNITION FUNCTION
 # --------------------------------------------
 
-async def google_stt_stream(chunks: list) -> str:
-    """Send raw audio chunks to Google Speech-to-Text."""
+async def google_stt_stream(audio_q: asyncio.Queue, on_partial=None) -> str:
+    """Stream audio chunks to Google Speech-to-Text as they arrive on audio_q.
+
+    A ``None`` on the queue ends the utterance. Interim hypotheses are passed
+    to the ``on_partial`` coroutine; the joined final transcript is returned.
+    """
+    loop = asyncio.get_running_loop()
+
     streaming_config = speech.StreamingRecognitionConfig(
         config=speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
@@ -97,75 +180,302 @@ async def google_stt_stream(chunks: list) -> str:
             language_code=LANGUAGE,
             enable_automatic_punctuation=True
         ),
-        interim_results=False
+        interim_results=True
     )
 
+    # gRPC pulls requests from its own thread, so block it on the asyncio queue.
+    # Incoming frames are re-cut into 100 ms requests whatever size they arrive in.
     def request_gen():
-        for ch in chunks:
-            yield speech.StreamingRecognizeRequest(audio_content=ch)
+        buf = bytearray()
+        while True:
+            ch = asyncio.run_coroutine_threadsafe(audio_q.get(), loop).result()
+            if ch is None:
+                break
+            buf.extend(ch)
+
+            if len(buf) >= STT_CHUNK_BYTES:
+                view = memoryview(buf)
+                end = len(buf) - len(buf) % STT_CHUNK_BYTES
+                for i in range(0, end, STT_CHUNK_BYTES):
+                    yield speech.StreamingRecognizeRequest(audio_content=view[i:i + STT_CHUNK_BYTES].tobytes())
+                view.release()
+                del buf[:end]
+
+        if buf:
+            yield speech.StreamingRecognizeRequest(audio_content=bytes(buf))
+
+    def recognize():
+        finals = []
+        responses = speech_client.streaming_recognize(
+            config=streaming_config,
+            requests=request_gen()
+        )
 
-    responses = speech_client.streaming_recognize(
-        config=streaming_config,
-        requests=request_gen()
-    )
+        for response in responses:
+            for result in response.results:
+                if not result.alternatives:
+                    continue
+                if result.is_final:
+                    finals.append(result.alternatives[0].transcript.strip())
+                elif on_partial:
+                    asyncio.run_coroutine_threadsafe(on_partial(result.alternatives[0].transcript), loop)
 
-    for response in responses:
-        for result in response.results:
-            if result.is_final:
-                return result.alternatives[0].transcript
+        return " ".join(t for t in finals if t)
 
-    return ""
+    return await loop.run_in_executor(stt_pool, recognize)
 
 
 # --------------------------------------------
 # TTS ENGINE
 # --------------------------------------------
 
-def tts_synthesize_wav(text: str) -> bytes:
-    engine = pyttsx3.init()
-    engine.setProperty("rate", 150)
+# pyttsx3 isn't thread-safe, so the shared engine and its scratch file are
+# only touched while holding _tts_lock.
+_tts_lock = threading.Lock()
+_tts_engine = None
+_tts_wav_path = None
+
+
+def _get_tts_engine():
+    global _tts_engine, _tts_wav_path
+    if _tts_engine is None:
+        engine = pyttsx3.init()
+        engine.setProperty("rate", TTS_RATE)
+
+        for v in engine.getProperty("voices"):
+            if TTS_VOICE_HINT in v.name.lower():
+                engine.setProperty("voice", v.id)
+
+        fd, _tts_wav_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        _tts_engine = engine
+    return _tts_engine
+
+
+def tts_synthesize_pcm(text: str) -> tuple:
+    """Synthesize text and return (sample_rate, channels, pcm16_bytes)."""
+    with _tts_lock:
+        engine = _get_tts_engine()
+        engine.save_to_file(text, _tts_wav_path)
+        engine.runAndWait()
+
+        with open(_tts_wav_path, "rb") as f:
+            wav = f.read()
+
+    with wave.open(io.BytesIO(wav), "rb") as w:
+        return w.getframerate(), w.getnchannels(), w.readframes(w.getnframes())
+
+
+# Synthesized audio keyed by sha1(voice|rate|text), most recently used last
+tts_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def tts_cache_key(text: str) -> str:
+    return hashlib.sha1(f"{TTS_VOICE_HINT}|{TTS_RATE}|{text}".encode("utf-8")).hexdigest()
+
+
+def tts_cache_get(key: str) -> Optional[tuple]:
+    audio = tts_cache.get(key)
+    if audio is not None:
+        tts_cache.move_to_end(key)
+    return audio
+
+
+def tts_cache_put(key: str, audio: tuple):
+    tts_cache[key] = audio
+    tts_cache.move_to_end(key)
+    while len(tts_cache) > TTS_CACHE_SIZE:
+        tts_cache.popitem(last=False)
+
 
-    for v in engine.getProperty("voices"):
-        if "female" in v.name.lower():
-            engine.setProperty("voice", v.id)
+# Replies spoken on (nearly) every connection. Synthesized once at startup and
+# kept outside the LRU so a burst of unique replies can never evict them.
+FIXED_TTS_TEXTS = (GREETING_MESSAGE, FALLBACK_MESSAGE)
+fixed_tts: Dict[str, tuple] = {}
 
-    fd, path = tempfile.mkstemp(suffix=".wav")
-    os.close(fd)
-    engine.save_to_file(text, path)
-    engine.runAndWait()
 
-    with open(path, "rb") as f:
-        audio = f.read()
-    os.remove(path)
+async def synthesize_cached(text: str) -> tuple:
+    """Return (sample_rate, channels, pcm) for text, only running pyttsx3 on a cache miss."""
+    audio = fixed_tts.get(text)
+    if audio is not None:
+        return audio
+
+    key = tts_cache_key(text)
+    audio = tts_cache_get(key)
+    if audio is None:
+        audio = await run_io(tts_synthesize_pcm, text)
+        tts_cache_put(key, audio)
     return audio
 
 
-async def stream_audio(ws: WebSocket, audio: bytes):
+async def prewarm_tts_cache():
+    """Synthesize the fixed replies up front so the first connection doesn't pay for them."""
+    for text in FIXED_TTS_TEXTS:
+        if text in fixed_tts:
+            continue
+        try:
+            fixed_tts[text] = await run_io(tts_synthesize_pcm, text)
+        except Exception as e:
+            print("TTS prewarm failed:", e)
+
+
+async def stream_audio(ws: WebSocket, audio: tuple):
+    sr, channels, pcm = audio
+    await ws.send_text(orjson.dumps({"type": "audio_start", "sr": sr, "channels": channels}).decode())
+
+    tag = bytes([FRAME_TTS_AUDIO])
     chunk_size = 32 * 1024
-    for i in range(0, len(audio), chunk_size):
-        data = base64.b64encode(audio[i:i+chunk_size]).decode()
-        await ws.send_text(json.dumps({"type": "audio_chunk", "data": data}))
-        await asyncio.sleep(0.003)
+    for n, i in enumerate(range(0, len(pcm), chunk_size), 1):
+        await ws.send_bytes(tag + pcm[i:i+chunk_size])
+        # send_bytes usually completes without suspending, so let other
+        # connections run now and then during long replies
+        if n % 8 == 0:
+            await asyncio.sleep(0)
 
-    await ws.send_text(json.dumps({"type": "audio_done"}))
+    await ws.send_text(orjson.dumps({"type": "audio_done"}).decode())
 
 
 # --------------------------------------------
 # GEMINI LOGIC
 # --------------------------------------------
 
-async def ask_gemini(prompt: str) -> Optional[dict]:
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class JsonStringFieldReader:
+    """Incrementally decode one string field out of a JSON object as it streams in."""
+
+    def __init__(self, field: str):
+        self._value_start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._raw = ""
+        self._pos = None  # index of the first undecoded char of the value
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """Append streamed text and return the newly decoded part of the field."""
+        self._raw += chunk
+        if self.done:
+            return ""
+
+        if self._pos is None:
+            m = self._value_start.search(self._raw)
+            if not m:
+                return ""
+            self._pos = m.end()
+
+        raw, i, out = self._raw, self._pos, []
+        while i < len(raw):
+            c = raw[i]
+            if c == '"':
+                self.done = True
+                break
+            if c != "\\":
+                out.append(c)
+                i += 1
+                continue
+
+            # Escape sequence: wait for the rest of it if it got split across chunks
+            if i + 1 >= len(raw):
+                break
+            if raw[i + 1] != "u":
+                out.append(_JSON_ESCAPES.get(raw[i + 1], raw[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(raw):
+                break
+            code = int(raw[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:  # high surrogate, needs its \uXXXX low half
+                if i + 12 > len(raw):
+                    break
+                low = int(raw[i + 8:i + 12], 16)
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                i += 6
+            out.append(chr(code))
+            i += 6
+
+        self._pos = i
+        return "".join(out)
+
+
+_GEMINI_MODEL = "gemini-2.5-flash"
+
+# Built once: model_json_schema() walks the whole pydantic model
+_GEMINI_CFG = {
+    "response_mime_type": "application/json",
+    "response_schema": FlossyAIResponse.model_json_schema()
+}
+
+_VOICE_PROMPT_TMPL = """
+You are FlossyAI, a dental assistant. Fill the JSON schema strictly.
+USER: "{text}"
+STATE: {st}
+"""
+
+_TEXT_PROMPT_TMPL = """
+You are FlossyAI (TEXT MODE).
+Start the very first chat with:
+"Hi! Welcome to Smile Artists Dental Studio! I am Flossy AI. How can I help you?"
+
+If the first message is not a greeting, simply answer the user's query.
+
+Follow the SAME JSON schema and rules as voice mode.
+
+**CURRENT TIME: {current_time_utc}**
+- Suggest future date/time relative to CURRENT TIME if needed.
+
+Booking requires: name, date, time, phone, symptom_message.
+Cancellation requires: phone.
+
+Ask name, date, time, phone, symptom message one chat by one chat.
+USER: "{query}"
+STATE: {st}
+"""
+
+
+async def ask_gemini(prompt: str, on_sentence=None) -> Optional[dict]:
+    """Ask Gemini for a FlossyAIResponse dict.
+
+    The response is streamed; if ``on_sentence`` is given, every complete
+    sentence of the ``message`` field is handed to it as soon as it arrives.
+    """
     try:
-        resp = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
+        reader = JsonStringFieldReader("message")
+        pending = ""
+        parts = []
+
+        stream = await genai_client.aio.models.generate_content_stream(
+            model=_GEMINI_MODEL,
             contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": FlossyAIResponse.model_json_schema()
-            }
+            config=_GEMINI_CFG
         )
 
-        clean_text = resp.text.strip()
+        async for chunk in stream:
+            if not chunk.text:
+                continue
+            parts.append(chunk.text)
+
+            if on_sentence:
+                pending += reader.feed(chunk.text)
+                *sentences, pending = SENTENCE_END.split(pending)
+                for sentence in sentences:
+                    if sentence.strip():
+                        on_sentence(sentence.strip())
+
+        if on_sentence and pending.strip():
+            on_sentence(pending.strip())
+
+        text = "".join(parts)
+
+        # With response_mime_type + response_schema the body is plain JSON;
+        # only fall back to fence stripping if it doesn't validate.
+        try:
+            return FlossyAIResponse.model_validate_json(text).model_dump()
+        except ValueError:
+            pass
+
+        clean_text = text.strip()
 
         if clean_text.startswith("```json"):
             clean_text = clean_text[7:].strip()
@@ -184,15 +494,24 @@ async def ask_gemini(prompt: str) -> Optional[dict]:
 # SLOT AVAILABILITY + BOOKING LOGIC
 # --------------------------------------------
 
-def is_slot_available(db, slot_time):
-    slot_end = slot_time + timedelta(minutes=SLOT_DURATION_MINUTES)
-    conflict = db.query(Appointment).filter(
+def scheduled_appointment_times(db, start, end) -> list:
+    """Sorted start times of scheduled appointments in [start, end), in one query."""
+    rows = db.query(Appointment.datetime).filter(
         Appointment.status == "scheduled",
-        Appointment.datetime < slot_end,
-        (Appointment.datetime + timedelta(minutes=SLOT_DURATION_MINUTES)) > slot_time,
-    ).first()
+        Appointment.datetime >= start,
+        Appointment.datetime < end,
+    ).order_by(Appointment.datetime.asc()).all()
+
+    # SQLite hands back naive datetimes even for timezone-aware columns
+    return [dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc) for (dt,) in rows]
+
 
-    return conflict is None
+def is_slot_available(taken, slot_time):
+    """Check slot_time against the sorted appointment start times in taken."""
+    duration = timedelta(minutes=SLOT_DURATION_MINUTES)
+    # First appointment that still runs past slot_time must start after the slot ends
+    i = bisect_right(taken, slot_time - duration)
+    return i == len(taken) or taken[i] >= slot_time + duration
 
 
 def find_next_available_slot(db, preferred_dt):
@@ -206,16 +525,23 @@ def find_next_available_slot(db, preferred_dt):
         preferred_dt += timedelta(days=1)
         preferred_dt = preferred_dt.replace(hour=BUSINESS_START_HOUR, minute=0)
 
+    candidates = []
     for _ in range(1000):
         if BUSINESS_START_HOUR <= preferred_dt.hour < BUSINESS_END_HOUR and preferred_dt > now:
-            if is_slot_available(db, preferred_dt):
-                return preferred_dt
+            candidates.append(preferred_dt)
 
         preferred_dt += timedelta(minutes=30)
         if preferred_dt.hour >= BUSINESS_END_HOUR:
             preferred_dt += timedelta(days=1)
             preferred_dt = preferred_dt.replace(hour=BUSINESS_START_HOUR, minute=0)
 
+    if candidates:
+        duration = timedelta(minutes=SLOT_DURATION_MINUTES)
+        taken = scheduled_appointment_times(db, candidates[0] - duration, candidates[-1] + duration)
+        for slot in candidates:
+            if is_slot_available(taken, slot):
+                return slot
+
     return now + timedelta(days=1)
 
 
@@ -223,7 +549,7 @@ def execute_booking(db, st, db_user_id=None):
     now = datetime.now(timezone.utc)
 
     try:
-        parsed = dtparser.parse(f"{st['date']} {st['time']}")
+        parsed = dtparser.parse(f"{st.date} {st.time}")
         if parsed.tzinfo is None:
             parsed = parsed.replace(tzinfo=timezone.utc)
         preferred_dt = parsed
@@ -232,11 +558,11 @@ def execute_booking(db, st, db_user_id=None):
 
     dt_final = find_next_available_slot(db, preferred_dt)
 
-    patient = db.query(Patient).filter(Patient.phone == st["phone"]).first()
+    patient = db.query(Patient).filter(Patient.phone == st.phone).first()
     if not patient:
-        patient = Patient(name=st["name"], phone=st["phone"], user_id=db_user_id)
+        patient = Patient(name=st.name, phone=st.phone, user_id=db_user_id)
         db.add(patient)
-        db.commit()
+        db.flush()  # assigns patient.id; committed together with the appointment
 
     appt = Appointment(
         patient_id=patient.id,
@@ -251,14 +577,57 @@ def execute_booking(db, st, db_user_id=None):
     return dt_final
 
 
+# These open their own session so they can run on io_pool workers
+
+def book_appointment(st, db_user_id=None):
+    with SessionLocal() as db:
+        return execute_booking(db, st, db_user_id)
+
+
+def cancel_appointment(phone) -> str:
+    """Cancel the patient's scheduled appointment.
+
+    Returns "cancelled", "no_patient" or "no_appointment".
+    """
+    with SessionLocal() as db:
+        p = db.query(Patient).filter(Patient.phone == phone).first()
+        if not p:
+            return "no_patient"
+
+        appt = (
+            db.query(Appointment)
+            .filter(
+                Appointment.patient_id == p.id,
+                Appointment.status == "scheduled"
+            )
+            .first()
+        )
+
+        if not appt:
+            return "no_appointment"
+
+        appt.status = "cancelled"
+        db.commit()
+        return "cancelled"
+
+
 # --------------------------------------------
 # SEND BOT MESSAGE + TTS
 # --------------------------------------------
 
 async def send_bot(ws, text):
-    await ws.send_text(json.dumps({"type": "bot_text", "text": text}))
-    wav = await asyncio.get_running_loop().run_in_executor(None, tts_synthesize_wav, text)
-    await stream_audio(ws, wav)
+    await ws.send_text(orjson.dumps({"type": "bot_text", "text": text}).decode())
+    audio = await synthesize_cached(text)
+    await stream_audio(ws, audio)
+
+
+async def speak_queued(ws, queue: asyncio.Queue):
+    """Send queued texts one after another so their audio plays in order; stops at None."""
+    while True:
+        text = await queue.get()
+        if text is None:
+            return
+        await send_bot(ws, text)
 
 
 # --------------------------------------------
@@ -267,33 +636,77 @@ async def send_bot(ws, text):
 
 async def handle_user_utterance(ws, text, db_user_id=None):
     cid = id(ws)
-    db = SessionLocal()
 
-    st = voice_states.get(cid, {})
+    st = voice_states.get(cid) or ConnState()
 
-    prompt = f"""
-You are FlossyAI, a dental assistant. Fill the JSON schema strictly.
-USER: "{text}"
-STATE: {st}
-"""
+    prompt = _VOICE_PROMPT_TMPL.format(text=text, st=asdict(st))
 
-    ai = await ask_gemini(prompt)
-    if not ai:
-        return await send_bot(ws, "I couldn’t understand that, could you repeat?")
+    # Speak the reply sentence by sentence while the rest is still streaming
+    sentences = asyncio.Queue()
+    spoken = []
+
+    def on_sentence(sentence):
+        spoken.append(sentence)
+        sentences.put_nowait(sentence)
 
-    for k in ["name", "date", "time", "phone", "symptom_message"]:
-        if ai.get(k):
-            st[k] = ai[k]
+    speaker = asyncio.create_task(speak_queued(ws, sentences))
+    try:
+        ai = await ask_gemini(prompt, on_sentence=on_sentence)
+        sentences.put_nowait(None)
+        await speaker
+    except BaseException:
+        # Barge-in cancels this turn: drop the queued sentences rather than
+        # speaking them over the next reply
+        speaker.cancel()
+        raise
+
+    if not ai:
+        return await send_bot(ws, FALLBACK_MESSAGE)
 
+    st.merge(ai)
     voice_states[cid] = st
 
     if ai.get("ready_for_booking"):
-        final_dt = execute_booking(db, st, db_user_id)
-        voice_states[cid] = {}
+        # Reset first: if this turn is interrupted, the next one must not
+        # re-send these details to Gemini and book a second time
+        voice_states[cid] = ConnState()
+        try:
+            final_dt, interrupted = await run_io_to_completion(book_appointment, st, db_user_id)
+        except Exception:
+            voice_states[cid] = st
+            raise
+
+        # A barge-in during the write still gets the confirmation spoken
         msg = final_dt.strftime("%A, %B %d at %I:%M %p UTC")
-        return await send_bot(ws, f"Your appointment is confirmed for {msg}!")
+        await send_bot(ws, f"Your appointment is confirmed for {msg}!")
+        if interrupted:
+            raise asyncio.CancelledError
+        return
+
+    if not spoken:
+        return await send_bot(ws, ai["message"])
+
+
+async def handle_user_utterance_voice(ws, content: bytes, db_user_id=None):
+    """Transcribe one complete utterance and answer it out loud.
+
+    ``content`` is raw LINEAR16 PCM at SAMPLE_RATE (a binary websocket frame
+    in reminders.py). The reply is spoken sentence by sentence through
+    handle_user_utterance as Gemini streams it.
+    """
+    audio_q = asyncio.Queue()
+    audio_q.put_nowait(content)
+    audio_q.put_nowait(None)
+    transcript = await google_stt_stream(audio_q)
+
+    await ws.send_text(orjson.dumps({
+        "type": "transcript",
+        "final": True,
+        "text": transcript
+    }).decode())
 
-    return await send_bot(ws, ai["message"])
+    if transcript:
+        await handle_user_utterance(ws, transcript, db_user_id)
 
 # --------------------------------------------
 # TEXT MODE HANDLER — for /ai_response endpoint
@@ -303,85 +716,57 @@ async def handle_user_utterance_text(
     user: str = "default",
     db_user_id: Optional[int] = None
 ):
-    db = SessionLocal()
-    st = text_states.get(user, {})
+    st = text_states.get(user) or ConnState()
 
     current_time_utc = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-    prompt = f"""
-You are FlossyAI (TEXT MODE).
-Start the very first chat with:
-"Hi! Welcome to Smile Artists Dental Studio! I am Flossy AI. How can I help you?"
-
-If the first message is not a greeting, simply answer the user's query.
-
-Follow the SAME JSON schema and rules as voice mode.
-
-**CURRENT TIME: {current_time_utc}**
-- Suggest future date/time relative to CURRENT TIME if needed.
-
-Booking requires: name, date, time, phone, symptom_message.
-Cancellation requires: phone.
-
-Ask name, date, time, phone, symptom message one chat by one chat.
-USER: "{query}"
-STATE: {st}
-"""
+    prompt = _TEXT_PROMPT_TMPL.format(current_time_utc=current_time_utc, query=query, st=asdict(st))
 
     ai = await ask_gemini(prompt)
     if not ai:
-        return "Sorry, I couldn’t understand that."
+        return TEXT_FALLBACK_MESSAGE
 
     # Update state
-    for k in ["name", "date", "time", "phone", "symptom_message"]:
-        if ai.get(k):
-            st[k] = ai[k]
-
+    st.merge(ai)
     text_states[user] = st
 
     # ------------------------------
     # APPOINTMENT BOOKING
     # ------------------------------
     if ai.get("ready_for_booking"):
-        dt_final = execute_booking(db, st, db_user_id)
-        text_states[user] = {}
+        # Reset before awaiting so a cancelled request can't leave the details
+        # behind for the next message to book again
+        text_states[user] = ConnState()
+        try:
+            dt_final = await run_io(book_appointment, st, db_user_id)
+        except Exception:
+            text_states[user] = st
+            raise
 
         formatted_time = dt_final.strftime('%A, %B %d at %I:%M %p UTC')
 
         return (
-            f"All set, {st['name']}! 🎉 Your appointment with "
+            f"All set, {st.name}! 🎉 Your appointment with "
             f"{DEFAULT_DOCTOR_NAME} is booked for {formatted_time}. "
-            f"We have recorded your reason as: {st['symptom_message']}."
+            f"We have recorded your reason as: {st.symptom_message}."
         )
 
     # ------------------------------
     # APPOINTMENT CANCELLATION
     # ------------------------------
     if ai.get("ready_for_cancellation"):
-        phone = st.get("phone")
+        phone = st.phone
         if not phone:
             return "Please provide the phone number."
 
-        p = db.query(Patient).filter(Patient.phone == phone).first()
-        if not p:
+        outcome = await run_io(cancel_appointment, phone)
+        if outcome == "no_patient":
             return "No appointments found for that phone number."
 
-        appt = (
-            db.query(Appointment)
-            .filter(
-                Appointment.patient_id == p.id,
-                Appointment.status == "scheduled"
-            )
-            .first()
-        )
-
-        if not appt:
+        if outcome == "no_appointment":
             return "There is no appointment to cancel."
 
-        appt.status = "cancelled"
-        db.commit()
-
-        text_states[user] = {}
+        text_states[user] = ConnState()
         return "Your appointment has been cancelled 😊"
 
     # ------------------------------
@@ -394,37 +779,77 @@ STATE: {st}
 # WEBSOCKET ENDPOINT WITH GOOGLE STT
 # --------------------------------------------
 
+@app.on_event("startup")
+async def on_startup():
+    await prewarm_tts_cache()
+
+
 @app.websocket("/ws/agent")
 async def agent_ws_endpoint(ws: WebSocket):
     await ws.accept()
     print("🎤 Connected")
 
     cid = id(ws)
-    voice_states[cid] = {}
+    voice_states[cid] = ConnState()
 
-    await send_bot(ws, "Hello! I'm FlossyAI. How can I assist you today?")
+    # One recognize stream per utterance, opened on its first audio chunk
+    audio_q = None
+    stt_task = None
 
-    buffer = []
+    async def send_partial(text):
+        await ws.send_text(orjson.dumps({
+            "type": "transcript",
+            "final": False,
+            "text": text
+        }).decode())
 
     try:
-        while True:
-            data = json.loads(await ws.receive_text())
-
-            if data["type"] == "audio_chunk":
-                buffer.append(base64.b64decode(data["data"]))
+        await send_bot(ws, GREETING_MESSAGE)
 
-            elif data["type"] == "audio_done":
-                transcript = await google_stt_stream(buffer)
-                buffer = []
-
-                await ws.send_text(json.dumps({
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(msg.get("code", 1000))
+
+            frame = msg.get("bytes")
+            if not frame:
+                continue
+
+            if frame[0] == FRAME_AUDIO_CHUNK:
+                if stt_task is None:
+                    audio_q = asyncio.Queue()
+                    stt_task = asyncio.create_task(google_stt_stream(audio_q, send_partial))
+                audio_q.put_nowait(frame[1:])
+
+            elif frame[0] == FRAME_AUDIO_DONE:
+                if stt_task is None:
+                    continue
+
+                audio_q.put_nowait(None)
+                try:
+                    transcript = await stt_task
+                except Exception as e:
+                    print("STT Error:", e)
+                    transcript = None
+                finally:
+                    audio_q = stt_task = None
+
+                if transcript is None:
+                    await send_bot(ws, FALLBACK_MESSAGE)
+                    continue
+
+                await ws.send_text(orjson.dumps({
                     "type": "transcript",
                     "final": True,
                     "text": transcript
-                }))
+                }).decode())
 
                 asyncio.create_task(handle_user_utterance(ws, transcript))
 
     except WebSocketDisconnect:
         print("🔌 Disconnected")
-        voice_states.pop(cid, None)
\ No newline at end of file
+    finally:
+        voice_states.pop(cid, None)
+        # Ends the request generator so the recognize thread can exit
+        if stt_task is not None:
+            audio_q.put_nowait(None)
@@ -1,20 +1,70 @@
 import os
 import datetime
+import hashlib
 import httpx
+import orjson
 import asyncio
+from collections import OrderedDict
+from pathlib import Path
 from dotenv import load_dotenv
 from livekit import agents
 from livekit.agents import AgentSession
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import Patient, Interaction
+from utils.batch_writer import BatchWriter
+from utils.log import get_logger
 
 load_dotenv()
 
+logger = get_logger("flossy.call_agent")
+
 # --- ELEVENLABS CONFIG ---
-ELEVENLABS_TTS_URL = "https://api.elevenlabs.io/v1/text-to-speech"
+ELEVENLABS_BASE_URL = "https://api.elevenlabs.io"
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")  # default fallback voice ID
+TTS_MODEL_ID = "eleven_flash_v2_5"  # low-latency model for live calls
+TTS_STREAM_LATENCY = 3  # optimize_streaming_latency level (0-4)
+TTS_STREAM_CHUNK = 4096
+
+# --- TTS CACHE ---
+# In-memory LRU, keyed by tts_cache_key(). Only static text (persist=True,
+# e.g. GREETING_SUFFIX) also goes to disk, so personalised clips like
+# "Hello <name>." never leave memory and the directory stays bounded.
+TTS_CACHE_DIR = Path("tts_cache")
+TTS_CACHE_MAX = 1000
+_tts_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+
+def new_tts_client() -> httpx.AsyncClient:
+    """Pooled client for one job's TTS requests, so its calls reuse keep-alive
+    connections instead of paying a TCP+TLS handshake each time."""
+    return httpx.AsyncClient(
+        base_url=ELEVENLABS_BASE_URL,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+
+
+_TTS_HEADERS = {
+    "xi-api-key": ELEVENLABS_API_KEY,
+    "Content-Type": "application/json",
+}
+
+# The follow-up greeting is "Hello <name>." plus this fixed part, which is
+# synthesized once per agent and reused for every patient.
+GREETING_SUFFIX = (
+    "This is FlossyAI from your dental clinic. "
+    "We hope you're recovering well after your recent procedure. "
+    "Are you experiencing any discomfort or pain?"
+)
+
+# --- INTERACTION LOG ---
+# Calls queue their Interaction rows on the job's BatchWriter, which saves up
+# to INTERACTION_BATCH_MAX at once, waiting at most INTERACTION_FLUSH_SECONDS.
+INTERACTION_BATCH_MAX = 20
+INTERACTION_FLUSH_SECONDS = 0.1
 
 # --- LIVEKIT CONFIG ---
 LIVEKIT_URL = os.getenv("LIVEKIT_URL")
@@ -23,26 +73,30 @@ LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 
 
 class FlossyAgent(agents.Agent):
+    def __init__(self, *, tts_client: httpx.AsyncClient, interactions: BatchWriter, **kwargs):
+        super().__init__(**kwargs)
+        self._tts_client = tts_client
+        self._interactions = interactions
+
     async def on_start(self, session: AgentSession):
-        print("✅ FlossyAI started successfully — beginning call sequence.")
-        print("📞 FlossyAI is live and ready to make calls!")
+        logger.info("✅ FlossyAI started successfully — beginning call sequence.")
+        logger.info("📞 FlossyAI is live and ready to make calls!")
+
+        self._suffix_audio = await self.synthesize_speech(GREETING_SUFFIX, persist=True)
 
         # Fetch most recent patient
         with SessionLocal() as db:
             patient = db.query(Patient).order_by(Patient.contact_datetime.desc()).first()
             if not patient:
-                print("⚠️ No patient found to call.")
+                logger.warning("⚠️ No patient found to call.")
                 return
 
-            print(f"📲 Calling {patient.name} at {patient.phone}")
+            logger.info("📲 Calling %s at %s", patient.name, patient.phone)
             await self.call_patient(session, db, patient)
 
     async def call_patient(self, session: AgentSession, db: Session, patient: Patient):
-        message = (
-            f"Hello {patient.name}, this is FlossyAI from your dental clinic. "
-            f"We hope you're recovering well after your recent procedure. "
-            f"Are you experiencing any discomfort or pain?"
-        )
+        prefix = f"Hello {patient.name}."
+        message = f"{prefix} {GREETING_SUFFIX}"
 
         # Log interaction
         interaction = Interaction(
@@ -51,43 +105,128 @@ class FlossyAgent(agents.Agent):
             message=message,
             created_at=datetime.datetime.now(),
         )
-        db.add(interaction)
-        db.commit()
+        await self._interactions.put(interaction)
 
-        # Generate speech via ElevenLabs
-        audio = await self.synthesize_speech(message)
+        # Generate speech via ElevenLabs: only the short personalised prefix
+        # is new audio, the suffix comes from on_start. MP3 frames concatenate.
+        suffix_audio = getattr(self, "_suffix_audio", None) or await self.synthesize_speech(GREETING_SUFFIX, persist=True)
+        prefix_audio = await self.synthesize_speech(prefix)
+        audio = prefix_audio + suffix_audio if prefix_audio and suffix_audio else None
         if audio:
-            print(f"🔊 Voice generated for {patient.name}.")
+            logger.info("🔊 Voice generated for %s.", patient.name)
         else:
-            print("⚠️ Failed to generate voice.")
-
-        print(f"[Simulating call to {patient.phone}]")
-        print(f"Message spoken: {message}")
-
-    async def synthesize_speech(self, text: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{ELEVENLABS_TTS_URL}/{VOICE_ID}",
-                headers={
-                    "xi-api-key": ELEVENLABS_API_KEY,
-                    "Content-Type": "application/json",
-                },
-                json={"text": text, "model_id": "eleven_multilingual_v2"},
-            )
-            if response.status_code == 200:
-                return response.content
-            else:
-                print("ElevenLabs error:", response.text)
-                return None
+            logger.warning("⚠️ Failed to generate voice.")
+
+        logger.info("[Simulating call to %s]", patient.phone)
+        logger.info("Message spoken: %s", message)
+
+    async def synthesize_speech(self, text: str, persist: bool = False):
+        chunks = [chunk async for chunk in self.stream_speech(text, persist)]
+        return b"".join(chunks) or None
+
+    async def stream_speech(self, text: str, persist: bool = False):
+        """Yield MP3 chunks as ElevenLabs produces them; cached audio comes back in one piece."""
+        key = tts_cache_key(text)
+        audio = await tts_cache_get(key, persist)
+        if audio is not None:
+            yield audio
+            return
+
+        chunks = []
+        async with self._tts_client.stream(
+            "POST",
+            f"/v1/text-to-speech/{VOICE_ID}/stream",
+            params={"optimize_streaming_latency": TTS_STREAM_LATENCY},
+            headers=_TTS_HEADERS,
+            content=orjson.dumps({"text": text, "model_id": TTS_MODEL_ID}),
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                logger.error("ElevenLabs error: %s", response.text)
+                return
+
+            async for chunk in response.aiter_bytes(TTS_STREAM_CHUNK):
+                chunks.append(chunk)
+                yield chunk
+
+        # Only complete responses are cached
+        await tts_cache_put(key, b"".join(chunks), persist)
+
+
+def tts_cache_key(text: str) -> str:
+    normalized = " ".join(text.split()).lower()
+    return hashlib.sha256(f"{VOICE_ID}|{TTS_MODEL_ID}|{normalized}".encode("utf-8")).hexdigest()
+
+
+def _remember(key: str, audio: bytes):
+    _tts_cache[key] = audio
+    _tts_cache.move_to_end(key)
+    while len(_tts_cache) > TTS_CACHE_MAX:
+        _tts_cache.popitem(last=False)
+
+
+async def tts_cache_get(key: str, persist: bool = False):
+    """Return cached MP3 bytes from memory, then (for persist) disk, or None."""
+    audio = _tts_cache.get(key)
+    if audio is not None:
+        _tts_cache.move_to_end(key)
+        return audio
+    if not persist:
+        return None
+
+    path = TTS_CACHE_DIR / f"{key}.mp3"
+    try:
+        audio = await asyncio.to_thread(path.read_bytes)
+    except FileNotFoundError:
+        return None
+
+    _remember(key, audio)
+    return audio
+
+
+async def tts_cache_put(key: str, audio: bytes, persist: bool = False):
+    _remember(key, audio)
+    if not persist:
+        return
+    try:
+        TTS_CACHE_DIR.mkdir(exist_ok=True)
+        await asyncio.to_thread((TTS_CACHE_DIR / f"{key}.mp3").write_bytes, audio)
+    except OSError as e:
+        logger.warning("⚠️ Could not write TTS cache file: %s", e)
+
+
+def _save_interactions(batch: list):
+    with SessionLocal() as db:
+        db.bulk_save_objects(batch)
+        db.commit()
+
+
+async def _save_interactions_async(batch: list):
+    await asyncio.to_thread(_save_interactions, batch)
 
 
 # Entry point for LiveKit Agent Worker
 async def entrypoint(ctx: agents.JobContext):
     await ctx.connect()  # connects to the LiveKit room/session
 
+    # Client and writer belong to this job and are closed when it ends
+    tts_client = new_tts_client()
+    interactions = BatchWriter(
+        _save_interactions_async,
+        batch_max=INTERACTION_BATCH_MAX,
+        flush_seconds=INTERACTION_FLUSH_SECONDS,
+    )
+    interactions.start()
+    ctx.add_shutdown_callback(interactions.close)
+    ctx.add_shutdown_callback(tts_client.aclose)
+
     session = AgentSession(
         llm=None,  # Optional: you can integrate GPT or other LLMs here
-        agent=FlossyAgent(instructions="You are FlossyAI, a friendly dental assistant who follows up with patients after procedures.")
+        agent=FlossyAgent(
+            instructions="You are FlossyAI, a friendly dental assistant who follows up with patients after procedures.",
+            tts_client=tts_client,
+            interactions=interactions,
+        )
     )
 
     await session.start(room=ctx.room, agent=session.agent)
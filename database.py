@@ -1,5 +1,8 @@
 from sqlalchemy import create_engine, MetaData
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import StaticPool
 import os
 from dotenv import load_dotenv
 
@@ -15,13 +18,53 @@ if not DATABASE_URL:
 # --- SQLAlchemy Engine Setup ---
 # For SQLite, add `connect_args={"check_same_thread": False}`
 connect_args = {}
+pool_args = {}
+async_pool_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
+    # A plain in-memory database exists on one connection of one engine. Use a
+    # named shared-cache one so the sync and async engines see the same tables,
+    # kept alive by each engine's StaticPool connection.
+    if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+        DATABASE_URL = "sqlite:///file:flossy?mode=memory&cache=shared&uri=true"
+        pool_args = async_pool_args = {"poolclass": StaticPool}
+else:
+    # Every websocket turn and API request borrows a connection; drop ones the
+    # server has closed before handing them out, and reuse the most recent
+    # (LIFO) so idle extras can time out.
+    common_pool_args = {"pool_pre_ping": True, "pool_recycle": 1800, "pool_use_lifo": True}
+    # Both engines open connections to the same server, so they are sized
+    # together: at most DB_POOL_SIZE + DB_MAX_OVERFLOW connections per process,
+    # about two thirds sync. Keep that times the worker count under the
+    # server's max_connections (Postgres defaults to 100).
+    pool_size = int(os.getenv("DB_POOL_SIZE", "15"))
+    max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "15"))
+    async_pool_size = max(pool_size // 3, 1)
+    async_max_overflow = max_overflow // 3
+    pool_args = {
+        "pool_size": pool_size - async_pool_size,
+        "max_overflow": max_overflow - async_max_overflow,
+        **common_pool_args,
+    }
+    async_pool_args = {
+        "pool_size": async_pool_size,
+        "max_overflow": async_max_overflow,
+        **common_pool_args,
+    }
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **pool_args)
+
+# --- Async Engine (read-heavy endpoints) ---
+# Same database, reached through the asyncio driver for its dialect
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+_url = make_url(DATABASE_URL)
+ASYNC_DATABASE_URL = _url.set(drivername=ASYNC_DRIVERS.get(_url.get_backend_name(), _url.drivername))
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=connect_args, **async_pool_args)
 
 # --- Session Factory ---
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # --- Metadata and Base ---
 metadata = MetaData()
@@ -37,8 +80,18 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency to provide an AsyncSession per request."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Initialize the database and create tables if they don't exist."""
     from models import Base  # imported here to avoid circular import
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any newer indexes explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     print("✅ Database initialized and tables created (if not existing).")
@@ -1,6 +1,13 @@
+import os
 import firebase_admin
 from firebase_admin import credentials, messaging
 
-# Initialize Firebase app once globally
-cred = credentials.Certificate("firebase_credentials.json")
-firebase_admin.initialize_app(cred)
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "firebase_credentials.json")
+
+
+def init_firebase():
+    """Initialize the Firebase app once per process; later calls are no-ops."""
+    if firebase_admin._apps:
+        return
+    cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+    firebase_admin.initialize_app(cred)
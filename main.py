@@ -1,19 +1,24 @@
 import os
-import jwt
-import requests
-from datetime import datetime, timezone, timedelta
-from fastapi import FastAPI, Request, HTTPException, Depends
+import httpx
+import orjson
+from datetime import date, datetime, timezone, timedelta
+from functools import lru_cache
+from fastapi import FastAPI, Request, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from routers.sms import router as sms_router
 from agent_server import app as agent_app
-from database import init_db, SessionLocal
+from database import init_db, SessionLocal, AsyncSessionLocal, get_async_db
+from firebase_client import init_firebase
 from models import User, Patient, Appointment, Interaction
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session, joinedload
-from jwt import PyJWKClient
-from agent_server import handle_user_utterance_text
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from agent_server import handle_user_utterance_text, prewarm_tts_cache
+from utils.auth import CLERK_ISSUER, verify_token
 
 # --------------------------------------------------------------------------
 #                         ENV + CLERK SETUP
@@ -25,8 +30,6 @@ CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
 CLERK_PUBLISHABLE_KEY = os.getenv("CLERK_PUBLISHABLE_KEY")
 CLERK_CLIENT_ID = os.getenv("CLERK_CLIENT_ID")
 CLERK_CLIENT_SECRET = os.getenv("CLERK_CLIENT_SECRET")
-CLERK_ISSUER = os.getenv("CLERK_ISSUER", "https://meet-grouse-33.clerk.accounts.dev")
-JWKS_URL = f"{CLERK_ISSUER}/.well-known/jwks.json"
 
 if not all([CLERK_SECRET_KEY, CLERK_CLIENT_ID, CLERK_CLIENT_SECRET]):
     raise RuntimeError("❌ Missing Clerk credentials in .env file")
@@ -38,6 +41,7 @@ AUTHORIZED_DENTIST_EMAILS = [
     "dr.aishwarya@smileartists.com",
     "test_dentist@flossy.ai"
 ]
+AUTHORIZED_DENTIST_EMAILS_SET = frozenset(e.lower().strip() for e in AUTHORIZED_DENTIST_EMAILS)
 
 # --------------------------------------------------------------------------
 #                            FASTAPI SETUP
@@ -64,11 +68,30 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 # --------------------------------------------------------------------------
 #                             HELPER FUNCTIONS
 # --------------------------------------------------------------------------
+# Pages are read once at startup; with ENV=dev they're re-read on every
+# request so edits show up without a restart.
+HTML_CACHE: dict = {}
+HTML_LIVE_RELOAD = os.getenv("ENV") == "dev"
+
+
+def read_html(filename: str) -> bytes:
+    with open(os.path.join(static_dir, filename), "rb") as f:
+        return f.read()
+
+
+def preload_html():
+    for filename in os.listdir(static_dir):
+        if filename.endswith(".html"):
+            HTML_CACHE[filename] = read_html(filename)
+
+
 def load_html(filename: str):
     try:
-        file_path = os.path.join("flossy_web", filename)
-        with open(file_path, "r", encoding="utf-8") as f:
-            html = f.read()
+        html = None if HTML_LIVE_RELOAD else HTML_CACHE.get(filename)
+        if html is None:
+            html = read_html(filename)
+            if not HTML_LIVE_RELOAD:
+                HTML_CACHE[filename] = html
         return HTMLResponse(content=html, status_code=200)
     except Exception as e:
         return HTMLResponse(content=f"<h1>Error loading {filename}</h1><p>{e}</p>", status_code=500)
@@ -83,26 +106,6 @@ def get_db():
         db.close()
 
 
-def verify_token(token: str):
-    """Verify Clerk JWT and return the full payload. Accept small clock skew."""
-    try:
-        jwks_client = PyJWKClient(JWKS_URL)
-        signing_key = jwks_client.get_signing_key_from_jwt(token)
-        payload = jwt.decode(
-            token,
-            signing_key.key,
-            algorithms=["RS256"],
-            issuer=CLERK_ISSUER,
-            options={"verify_aud": False, "verify_iat": False}, 
-            leeway=10 
-        )
-        print("✅ Token verified successfully:", {k: payload.get(k) for k in ("sub","email","email_address")})
-        return payload
-    except Exception as e:
-        print("❌ JWT verification failed:", e)
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-
-
 def store_user_if_new(db: Session, email: str, role: str = None, name: str = None):
     """Safely store a user, updating role if missing."""
     user = None
@@ -114,7 +117,7 @@ def store_user_if_new(db: Session, email: str, role: str = None, name: str = Non
         email = email.lower().strip()
         valid_roles = {"dentist", "patient"}
         
-        user = db.query(User).filter(User.email.ilike(email)).first()
+        user = db.query(User).filter(User.email == email).first()
         
         if not user:
             # New user logic
@@ -145,8 +148,15 @@ def store_user_if_new(db: Session, email: str, role: str = None, name: str = Non
         return user
 
 
+@lru_cache(maxsize=1)
+def _day_range(day: date) -> tuple[datetime, datetime]:
+    """UTC [start, end) bounds for `day`; recomputed only when the date rolls over."""
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
 @app.get("/appointments/today")
-def get_today_appointments(request: Request, db: Session = Depends(get_db)):
+async def get_today_appointments(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Returns today's appointments:
     - Dentist: sees ALL appointments
@@ -157,58 +167,87 @@ def get_today_appointments(request: Request, db: Session = Depends(get_db)):
     if not token:
         raise HTTPException(status_code=400, detail="Missing token")
 
-    payload = verify_token(token)
+    # verify_token may fetch the JWKS over HTTPS; keep that off the event loop
+    payload = await run_in_threadpool(verify_token, token)
 
     email = payload.get("email") or payload.get("email_address")
     if not email:
         raise HTTPException(status_code=401, detail="Email missing in token")
+    email = email.lower().strip()
 
     # Get user
-    user = db.query(User).filter(User.email.ilike(email)).first()
+    user = await db.scalar(select(User).where(User.email == email))
     if not user:
         # If user is not in our DB but has a valid Clerk token, we need to create them before proceeding.
-        user = store_user_if_new(db, email, role=None)
+        user = await db.run_sync(store_user_if_new, email, role=None)
         if not user:
              raise HTTPException(status_code=404, detail="User lookup failed after token verification.")
 
     # ---- Today’s date range in UTC ----
-    now = datetime.now(timezone.utc)
-    start = datetime(now.year, now.month, now.day, 0, 0, tzinfo=timezone.utc)
-    end = start + timedelta(days=1)
+    start, end = _day_range(datetime.now(timezone.utc).date())
     
-    # Base query for all scheduled appointments today
-    base_query = db.query(Appointment).options(joinedload(Appointment.patient)).filter(
+    todays_filter = (
         Appointment.datetime >= start,
         Appointment.datetime < end,
         Appointment.status == "scheduled"
-    ).order_by(Appointment.datetime.asc())
-
-    # Dentist → show ALL appointments
-    if user.role == "dentist":
-        appts = base_query.all()
-    # Patient → show ONLY their linked appointments
-    else:
-        patient = db.query(Patient).filter(Patient.user_id == user.id).first()
-        if not patient:
+    )
+
+    # Latest interaction per patient (the booking reason), ranked in SQL so it
+    # comes back with the appointments instead of one query per row. Only
+    # today's patients are ranked, not the whole interaction history.
+    latest_msg_subq = (
+        select(
+            Interaction.patient_id,
+            Interaction.message,
+            func.row_number().over(
+                partition_by=Interaction.patient_id,
+                order_by=Interaction.created_at.desc()
+            ).label("rn")
+        )
+        .where(Interaction.patient_id.in_(select(Appointment.patient_id).where(*todays_filter)))
+        .subquery()
+    )
+
+    # Only the four columns the dashboard renders, no ORM objects
+    stmt = (
+        select(
+            Appointment.datetime,
+            Patient.name.label("patient_name"),
+            latest_msg_subq.c.message.label("reason"),
+            Appointment.doctor_name,
+        )
+        .select_from(Appointment)
+        .outerjoin(Patient, Patient.id == Appointment.patient_id)
+        .outerjoin(
+            latest_msg_subq,
+            and_(
+                latest_msg_subq.c.patient_id == Appointment.patient_id,
+                latest_msg_subq.c.rn == 1
+            )
+        )
+        .where(*todays_filter)
+        .order_by(Appointment.datetime.asc())
+    )
+
+    # Patient → show ONLY their linked appointments (dentist sees ALL)
+    if user.role != "dentist":
+        patient_id = await db.scalar(select(Patient.id).where(Patient.user_id == user.id))
+        if not patient_id:
             return {"appointments": []} # Patient user exists, but no linked Patient record yet.
 
-        appts = base_query.filter(Appointment.patient_id == patient.id).all()
+        stmt = stmt.where(Appointment.patient_id == patient_id)
 
     # ---- Serialize ----
+    rows = (await db.execute(stmt)).mappings().all()
     result = [
         {
-            "time": a.datetime.isoformat(),
-            "patient_name": a.patient.name if a.patient else "Unknown",
+            "time": r["datetime"].isoformat(),
+            "patient_name": r["patient_name"] or "Unknown",
             # Assuming symptom/reason is stored in the latest interaction log linked to the appointment's patient
-            "reason": (
-                db.query(Interaction.message)
-                .filter(Interaction.patient_id == a.patient_id)
-                .order_by(Interaction.created_at.desc())
-                .limit(1).scalar()
-            ) or "N/A", 
-            "doctor_name": a.doctor_name
+            "reason": r["reason"] or "N/A",
+            "doctor_name": r["doctor_name"]
         }
-        for a in appts
+        for r in rows
     ]
 
     return {"appointments": result}
@@ -234,7 +273,7 @@ async def ai_response(request: Request, payload: dict, db: Session = Depends(get
             
             email = payload.get("email") or payload.get("email_address")
             if email:
-                user = db.query(User).filter(User.email.ilike(email)).first()
+                user = db.query(User).filter(User.email == email.lower().strip()).first()
                 if user:
                     db_user_id = user.id
     except HTTPException:
@@ -252,18 +291,16 @@ async def ai_response(request: Request, payload: dict, db: Session = Depends(get
 # --------------------------------------------------------------------------
 
 @app.get("/", response_class=HTMLResponse)
-def serve_landing():
+async def serve_landing():
     return load_html("landing.html")
 
 
 @app.get("/login", response_class=HTMLResponse)
-def login_page():
+async def login_page():
     return load_html("login.html")
 
 @app.get("/signup_redirect", response_class=RedirectResponse)
 async def signup_redirect(request: Request, db: Session = Depends(get_db)):
-    token = await Clerk.session.getToken(...)  # Clerk handles internally
-
     token = request.query_params.get("token")
     if not token:
         # Clerk auto-attaches the token on redirect after signup
@@ -278,7 +315,7 @@ async def signup_redirect(request: Request, db: Session = Depends(get_db)):
     email = email.lower().strip()
 
     # Check if user is already in DB
-    user = db.query(User).filter(User.email.ilike(email)).first()
+    user = db.query(User).filter(User.email == email).first()
 
     if user and user.role:
         if user.role == "dentist":
@@ -294,36 +331,36 @@ async def signup_redirect(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/signup", response_class=HTMLResponse)
-def signup_page():
+async def signup_page():
     return load_html("signup.html")
 
 
 @app.get("/role_selection", response_class=HTMLResponse)
-def role_selection():
+async def role_selection():
     return load_html("role_selection.html")
 
 @app.get("/dental_tourism", response_class=HTMLResponse)
-def dental_tourism():
+async def dental_tourism():
     return load_html("dental_tourism.html")
 
 @app.get("/services", response_class=HTMLResponse)
-def services():
+async def services():
     return load_html("services.html")
     
 @app.get("/logout", response_class=HTMLResponse)
-def logout():
+async def logout():
     return RedirectResponse(url="/", status_code=302)
 
 
 @app.get("/dentist", response_class=HTMLResponse)
-def user_dashboard(request: Request):
+async def user_dashboard(request: Request):
     token = request.query_params.get("token")
     if not token:
         return RedirectResponse(url="/login")
     
     try:
-        # Attempt token verification
-        verify_token(token)
+        # Attempt token verification (may fetch Clerk's keys, so off the loop)
+        await run_in_threadpool(verify_token, token)
     except HTTPException:
         # If verification fails, redirect the user back to login
         print("⚠️ Token failed verification. Redirecting user to /login.")
@@ -333,14 +370,14 @@ def user_dashboard(request: Request):
 
 
 @app.get("/patient", response_class=HTMLResponse)
-def patient_dashboard(request: Request):
+async def patient_dashboard(request: Request):
     token = request.query_params.get("token")
     if not token:
         return RedirectResponse(url="/login")
 
     try:
-        # Attempt token verification
-        verify_token(token)
+        # Attempt token verification (may fetch Clerk's keys, so off the loop)
+        await run_in_threadpool(verify_token, token)
     except HTTPException:
         # If verification fails, redirect the user back to login
         print("⚠️ Token failed verification. Redirecting user to /login.")
@@ -349,9 +386,9 @@ def patient_dashboard(request: Request):
     return load_html("patient_dashboard.html")
 
 @app.get("/check_user_role")
-def check_user_role(email: str, db: Session = Depends(get_db)):
+async def check_user_role(email: str, db: AsyncSession = Depends(get_async_db)):
     email = email.lower().strip()
-    user = db.query(User).filter(User.email.ilike(email)).first()
+    user = await db.scalar(select(User).where(User.email == email))
 
     if not user:
         return {"exists": False}
@@ -387,7 +424,7 @@ async def redirect_user(request: Request, db: Session = Depends(get_db)):
         if not email and user_id_clerk:
             try:
                 headers = {"Authorization": f"Bearer {CLERK_SECRET_KEY}"}
-                resp = requests.get(f"{CLERK_ISSUER}/v1/users/{user_id_clerk}", headers=headers, timeout=6)
+                resp = await request.app.state.clerk_client.get(f"/v1/users/{user_id_clerk}", headers=headers)
                 if resp.status_code == 200:
                     user_data = resp.json()
                     # try new shape
@@ -426,7 +463,7 @@ async def redirect_user(request: Request, db: Session = Depends(get_db)):
         # Only check the whitelist if the role is being explicitly set to 'dentist'
         if role_param == "dentist":
             # Check if the user's email is in the authorized list
-            if email not in [e.lower() for e in AUTHORIZED_DENTIST_EMAILS]:
+            if email not in AUTHORIZED_DENTIST_EMAILS_SET:
                 # If unauthorized, force the role to 'patient'
                 role_param = "patient"
                 print(f"⚠️ UNAUTHORIZED DENTIST ATTEMPT: {email}. Forcing role to 'patient'.")
@@ -459,7 +496,7 @@ async def redirect_user(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/login?error=redirect_failure", status_code=302)
 
 @app.get("/.well-known/appspecific/{path:path}")
-def ignore_chrome_devtools(path: str):
+async def ignore_chrome_devtools(path: str):
     return JSONResponse({"status": "ignored"}, status_code=204)
 
 @app.get("/post_login", response_class=HTMLResponse)
@@ -471,19 +508,56 @@ async def clerk_signup_callback():
     return RedirectResponse(url="/post_login")
 
 @app.get("/debug_users", response_class=JSONResponse)
-def debug_users(db: Session = Depends(get_db)):
-    """Lists all users (for dev/debug)."""
-    users = db.query(User).all()
+async def debug_users(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Lists one page of users (for dev/debug)."""
+    users = (await db.scalars(select(User).order_by(User.id).offset(offset).limit(limit))).all()
     return {
         "count": len(users),
-        "users": [
-            {"id": u.id, "email": u.email, "role": u.role, "created_at": str(u.created_at)}
-            for u in users
-        ],
+        "limit": limit,
+        "offset": offset,
+        "users": [_debug_user(u) for u in users],
     }
 
 
+@app.get("/debug_users/stream")
+async def debug_users_stream():
+    """Dumps every user as NDJSON, reading the table in batches (for dev/debug)."""
+    async def rows():
+        # Own session: it has to outlive the handler while the body streams
+        async with AsyncSessionLocal() as db:
+            users = await db.stream_scalars(
+                select(User).order_by(User.id).execution_options(yield_per=500)
+            )
+            async for u in users:
+                yield orjson.dumps(_debug_user(u)) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
+def _debug_user(u: User) -> dict:
+    return {"id": u.id, "email": u.email, "role": u.role, "created_at": str(u.created_at)}
+
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
-    print("✅ FlossyAI server started | Clerk OAuth & JWT ready.")
\ No newline at end of file
+    init_firebase()
+    if not HTML_LIVE_RELOAD:
+        preload_html()
+    app.state.clerk_client = httpx.AsyncClient(
+        base_url=CLERK_ISSUER,
+        timeout=6.0,
+        limits=httpx.Limits(max_keepalive_connections=10, max_connections=50),
+    )
+    # Mounted sub-apps don't receive startup events, so warm the agent's TTS here
+    await prewarm_tts_cache()
+    print("✅ FlossyAI server started | Clerk OAuth & JWT ready.")
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await app.state.clerk_client.aclose()
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship, validates
 from database import Base
 from datetime import datetime, timezone
 
@@ -16,6 +16,11 @@ class User(Base):
     # Relationships
     patients = relationship("Patient", back_populates="user", cascade="all, delete-orphan")
 
+    @validates("email")
+    def normalize_email(self, key, email):
+        # Stored lowercase so lookups can be plain equality on the unique index
+        return email.lower().strip() if email else email
+
     def __repr__(self):
         return f"<User(email={self.email}, role={self.role})>"
 
@@ -35,6 +40,11 @@ class Patient(Base):
     appointments = relationship("Appointment", back_populates="patient", cascade="all, delete-orphan")
     interactions = relationship("Interaction", back_populates="patient", cascade="all, delete-orphan")
 
+    # The call agents pick the most recently contacted patient
+    __table_args__ = (
+        Index("ix_patients_contact_datetime", contact_datetime.desc()),
+    )
+
     def __repr__(self):
         return f"<Patient(name={self.name}, phone={self.phone})>"
 
@@ -50,6 +60,11 @@ class Appointment(Base):
     doctor_name = Column(String(120), nullable=False, default="Dr. Ava Sharma") # NEW COLUMN
     patient = relationship("Patient", back_populates="appointments")
 
+    # Slot lookups and /appointments/today filter on status and range-scan datetime
+    __table_args__ = (
+        Index("ix_appointments_status_datetime", "status", "datetime"),
+    )
+
     def __repr__(self):
         return f"<Appointment(patient_id={self.patient_id}, status={self.status}, datetime={self.datetime})>"
 
@@ -66,5 +81,10 @@ class Interaction(Base):
 
     patient = relationship("Patient", back_populates="interactions")
 
+    # Serves the "latest interaction per patient" lookup on the dashboard
+    __table_args__ = (
+        Index("ix_interactions_patient_created", "patient_id", "created_at"),
+    )
+
     def __repr__(self):
         return f"<Interaction(channel={self.channel}, message_length={len(self.message)})>"
\ No newline at end of file
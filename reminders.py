@@ -1,12 +1,30 @@
-from fastapi import FastAPI, WebSocket, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routers.sms import send_notification  # your Firebase or SMS sender
-from agent_server import handle_user_utterance_text, handle_user_utterance_voice
-from utils.auth import verify_token  # Clerk JWT verifier
-import json
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field
+from routers.sms import NotificationRequest, send_notification  # your Firebase or SMS sender
+from agent_server import (
+    TEXT_FALLBACK_MESSAGE,
+    handle_user_utterance_text,
+    handle_user_utterance_voice,
+    text_states,
+    voice_states,
+)
+from utils.auth import current_session  # Clerk JWT verifier
+from utils.log import get_logger
+import os
+import re
+import gzip
+import asyncio
+import hashlib
+import orjson
+from cachetools import TTLCache
+import jinja2
+from pathlib import Path
 
 app = FastAPI(title="FlossyAI – Smart Dental Assistant")
+logger = get_logger("flossy.reminders")
 
 # CORS setup
 app.add_middleware(
@@ -16,96 +34,213 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+INDEX_PATH = Path("templates/index.html")
+# Dashboards are per-user, so only the browser's own cache may reuse them
+DASHBOARD_HEADERS = {"Cache-Control": "private, max-age=30"}
+_INDEX_HTML = None
+_INDEX_GZ = None
+
+# Compiled once; autoescape keeps token claims from injecting markup
+_DASH_TMPL = jinja2.Template("""
+<html><body style='font-family:Poppins;text-align:center;'>
+<h1>Welcome, {{ role }}!</h1>
+<p>Authenticated User ID: {{ user_id }}</p>
+<p>Email: {{ email }}</p>
+</body></html>
+""", autoescape=True)
 
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    with open("templates/index.html", "r", encoding="utf-8") as f:
-        return HTMLResponse(content=f.read())
+async def root(request: Request):
+    # Read on first request rather than import, so the app still starts without templates/
+    global _INDEX_HTML, _INDEX_GZ
+    if _INDEX_HTML is None:
+        _INDEX_HTML = INDEX_PATH.read_bytes()
+        _INDEX_GZ = gzip.compress(_INDEX_HTML, 9)
+
+    # Pre-compressed once; GZipMiddleware passes already-encoded bodies through
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(
+            _INDEX_GZ,
+            media_type="text/html",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return Response(_INDEX_HTML, media_type="text/html", headers={"Vary": "Accept-Encoding"})
 
 # ------------------------- CHAT ROUTE -------------------------
+# Replies to repeated generic questions ("when do you open?"), keyed by a
+# digest of the normalized message
+_chat_cache = TTLCache(maxsize=2048, ttl=120)
+
+# Numbers (phones, dates), emails and introductions make a message personal
+CHAT_PII = re.compile(r"\d{3,}|@|\bmy name is\b", re.I)
+
+def _chat_key(user_msg: str) -> bytes:
+    normalized = " ".join(user_msg.lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+def _chat_state_empty() -> bool:
+    st = text_states.get("default")
+    return st is None or st.is_empty()
+
+class ChatIn(BaseModel):
+    message: str = Field(min_length=1)
+
 @app.post("/chat")
-async def chat_route(payload: dict):
+async def chat_route(payload: ChatIn):
     """Handles text-based AI chat requests"""
-    user_msg = payload.get("message", "")
-    if not user_msg:
-        raise HTTPException(status_code=400, detail="Message is empty")
+    user_msg = payload.message
+
+    # Only stateless exchanges are cacheable: nothing collected before the
+    # message, nothing collected because of it, and no personal details in it
+    cacheable = not CHAT_PII.search(user_msg) and _chat_state_empty()
+    key = _chat_key(user_msg) if cacheable else None
+    if key is not None and key in _chat_cache:
+        return {"reply": _chat_cache[key]}
 
     response_text = await handle_user_utterance_text(user_msg)
+    # The fallback means Gemini failed; caching it would repeat the outage
+    if key is not None and response_text != TEXT_FALLBACK_MESSAGE and _chat_state_empty():
+        _chat_cache[key] = response_text
     return {"reply": response_text}
 
 # ---------------------- WEBSOCKET VOICE ROUTE ----------------------
+WS_QUEUE_SIZE = 32
+
+def _log_job_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error("WebSocket job error", exc_info=task.exception())
+
+async def _reply_text(ws: WebSocket, content: str):
+    reply = await handle_user_utterance_text(content)
+    await ws.send_text(orjson.dumps({"type": "bot_text", "text": reply}).decode())
+
+async def _drain(ws: WebSocket, queue: asyncio.Queue):
+    """Dispatch queued messages so a long reply never blocks the receive loop.
+
+    Text replies run concurrently; a new audio message cancels the one still
+    being handled (barge-in) and starts once it has unwound.
+    """
+    audio_job = None
+    text_jobs = set()
+    try:
+        while True:
+            message = await queue.get()
+
+            if message["type"] == "audio":
+                if audio_job and not audio_job.done():
+                    audio_job.cancel()
+                    # Let it unwind first (a booking in flight finishes and is
+                    # confirmed) so the two replies never interleave on the socket
+                    await asyncio.gather(audio_job, return_exceptions=True)
+                audio_job = asyncio.create_task(handle_user_utterance_voice(ws, message["content"]))
+                audio_job.add_done_callback(_log_job_failure)
+            elif message["type"] == "text":
+                job = asyncio.create_task(_reply_text(ws, message["content"]))
+                text_jobs.add(job)
+                job.add_done_callback(text_jobs.discard)
+                job.add_done_callback(_log_job_failure)
+    finally:
+        jobs = [job for job in (audio_job, *text_jobs) if job]
+        for job in jobs:
+            job.cancel()
+        # Wait for them to unwind so none touches this socket's state afterwards
+        await asyncio.gather(*jobs, return_exceptions=True)
+
 @app.websocket("/ws/agent")
 async def agent_websocket(ws: WebSocket):
     """Handles live audio + text streaming with the voice agent"""
     await ws.accept()
+    queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+    consumer = asyncio.create_task(_drain(ws, queue))
     try:
         while True:
-            data = await ws.receive_text()
-            message = json.loads(data)
+            # Binary frames are raw Int16 PCM audio; text frames carry JSON control messages
+            frame = await ws.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            if frame.get("bytes") is not None:
+                message = {"type": "audio", "content": frame["bytes"]}
+            else:
+                message = orjson.loads(frame.get("text") or "{}")
+                if message.get("type") != "text":
+                    continue
 
-            if message["type"] == "audio":
-                await handle_user_utterance_voice(ws, message["content"])
-            elif message["type"] == "text":
-                reply = await handle_user_utterance_text(message["content"])
-                await ws.send_json({"type": "bot_text", "text": reply})
+            # Only decode + enqueue here; _drain does the work
+            await queue.put(message)
 
-    except Exception as e:
-        print("WebSocket error:", e)
+    except WebSocketDisconnect:
+        logger.info("🔌 Disconnected")
+    except Exception:
+        logger.exception("WebSocket error")
         await ws.close()
+    finally:
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        # handle_user_utterance keys booking state by id(ws); ids get reused,
+        # so drop it or the next socket could inherit this caller's details
+        voice_states.pop(id(ws), None)
 
 # ---------------------- NOTIFICATION ROUTE ----------------------
-@app.post("/send")
-async def send_notification_route(payload: dict):
-    """Send Firebase notification to device"""
-    try:
-        token = payload["token"]
-        title = payload["title"]
-        text = payload["text"]
-        result = send_notification({"token": token, "title": title, "text": text})
-        return {"status": "success", "result": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to send notification: {e}")
+SEND_ATTEMPTS = 3
+SEND_BACKOFF_SECONDS = 0.5  # doubled after each failed attempt
+
+async def _send_with_retry(req: NotificationRequest):
+    for attempt in range(1, SEND_ATTEMPTS + 1):
+        try:
+            result = await send_notification(req)
+            logger.info("Notification sent: %s", result)
+            return
+        except HTTPException as e:
+            if attempt == SEND_ATTEMPTS:
+                logger.error("Notification failed after %s attempts: %s", attempt, e.detail)
+                return
+            logger.warning("Notification attempt %s failed: %s", attempt, e.detail)
+            await asyncio.sleep(SEND_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+@app.post("/send", status_code=202)
+async def send_notification_route(req: NotificationRequest, bg: BackgroundTasks):
+    """Queue a Firebase notification to device; FCM is called after the response"""
+    if not req.token and not req.tokens:
+        raise HTTPException(status_code=400, detail="Provide a device token or tokens")
+
+    bg.add_task(_send_with_retry, req)
+    return {"status": "queued"}
 
 # ---------------------- DENTIST DASHBOARD ----------------------
 @app.get("/dentist", response_class=HTMLResponse)
-async def dentist_dashboard(request: Request):
-    token = request.query_params.get("token")
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing token")
-    try:
-        session_info = verify_token(token)
-        user_id = session_info.get("sub", "Unknown")
-        email = session_info.get("email", "Not available")
-
-        html = f"""
-        <html><body style='font-family:Poppins;text-align:center;'>
-        <h1>Welcome, Dentist!</h1>
-        <p>Authenticated User ID: {user_id}</p>
-        <p>Email: {email}</p>
-        </body></html>
-        """
-        return HTMLResponse(content=html)
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+async def dentist_dashboard(session_info: dict = Depends(current_session)):
+    user_id = session_info.get("sub", "Unknown")
+    email = session_info.get("email", "Not available")
+
+    return HTMLResponse(
+        content=_DASH_TMPL.render(role="Dentist", user_id=user_id, email=email),
+        headers=DASHBOARD_HEADERS,
+    )
 
 # ---------------------- PATIENT DASHBOARD ----------------------
 @app.get("/patient", response_class=HTMLResponse)
-async def patient_dashboard(request: Request):
-    token = request.query_params.get("token")
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing token")
-    try:
-        session_info = verify_token(token)
-        user_id = session_info.get("sub", "Unknown")
-        email = session_info.get("email", "Not available")
-
-        html = f"""
-        <html><body style='font-family:Poppins;text-align:center;'>
-        <h1>Welcome, Patient!</h1>
-        <p>Authenticated User ID: {user_id}</p>
-        <p>Email: {email}</p>
-        </body></html>
-        """
-        return HTMLResponse(content=html)
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+async def patient_dashboard(session_info: dict = Depends(current_session)):
+    user_id = session_info.get("sub", "Unknown")
+    email = session_info.get("email", "Not available")
+
+    return HTMLResponse(
+        content=_DASH_TMPL.render(role="Patient", user_id=user_id, email=email),
+        headers=DASHBOARD_HEADERS,
+    )
+
+# ---------------------- LAUNCHER ----------------------
+if __name__ == "__main__":
+    import uvicorn
+
+    # Same stack as the Procfile's main app: uvloop event loop, httptools parser
+    uvicorn.run(
+        "reminders:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
@@ -1,30 +1,59 @@
+import asyncio
+from typing import List, Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from firebase_admin import messaging
-from firebase_client import firebase_admin
+from firebase_client import init_firebase
 
 router = APIRouter()
 
+# FCM accepts at most this many messages per send_each call
+FCM_BATCH_LIMIT = 500
+
 class NotificationRequest(BaseModel):
-    token: str
+    token: Optional[str] = None
+    tokens: Optional[List[str]] = None
     title: str
     text: str
 
 @router.post("/send")
-def send_notification(request: NotificationRequest):
+async def send_notification(request: NotificationRequest):
+    if not request.token and not request.tokens:
+        raise HTTPException(status_code=400, detail="Provide a device token or tokens")
+
     try:
-        # Create a notification message
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=request.title,
-                body=request.text
-            ),
-            token=request.token
+        # No-op once main's startup hook (or an earlier send) has run
+        init_firebase()
+
+        notification = messaging.Notification(
+            title=request.title,
+            body=request.text
         )
 
-        # Send it via FCM
-        response = messaging.send(message)
-        return {"message": "Notification sent successfully!", "response": response}
+        # Single device: one plain send
+        if not request.tokens:
+            message = messaging.Message(notification=notification, token=request.token)
+            # firebase-admin is blocking HTTP; keep it off the event loop
+            response = await asyncio.to_thread(messaging.send, message)
+            return {"message": "Notification sent successfully!", "response": response}
+
+        # Several devices: batch them so N tokens cost one request per FCM_BATCH_LIMIT
+        tokens = list(dict.fromkeys(request.tokens + ([request.token] if request.token else [])))
+        success_count = failure_count = 0
+        for start in range(0, len(tokens), FCM_BATCH_LIMIT):
+            messages = [
+                messaging.Message(notification=notification, token=t)
+                for t in tokens[start:start + FCM_BATCH_LIMIT]
+            ]
+            batch = await asyncio.to_thread(messaging.send_each, messages)
+            success_count += batch.success_count
+            failure_count += batch.failure_count
+
+        return {
+            "message": "Notifications sent!",
+            "success_count": success_count,
+            "failure_count": failure_count,
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
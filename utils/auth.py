@@ -0,0 +1,111 @@
+import os
+import time
+import hashlib
+import threading
+import jwt
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, Security
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jwt import PyJWKClient
+
+load_dotenv()
+
+CLERK_ISSUER = os.getenv("CLERK_ISSUER", "https://meet-grouse-33.clerk.accounts.dev")
+JWKS_URL = f"{CLERK_ISSUER}/.well-known/jwks.json"
+
+# Shared across requests so the JWKS is fetched once and its keys are cached
+JWKS_CLIENT = PyJWKClient(JWKS_URL, cache_keys=True, max_cached_keys=16, lifespan=3600)
+
+# Resolved signing keys by `kid`, so a cold token is a dict lookup rather
+# than a JWKS round-trip; dropped when a signature fails in case Clerk rotated.
+_signing_keys = TTLCache(maxsize=16, ttl=600)
+
+TOKEN_LEEWAY_SECONDS = 10
+
+# Verified payloads keyed by a sha256 prefix of the token, so raw tokens are
+# never kept in memory. Rejected tokens are remembered briefly so a flood of
+# bad ones doesn't cost a signature check each.
+_verified_tokens = TTLCache(maxsize=10000, ttl=30)
+_rejected_tokens = TTLCache(maxsize=10000, ttl=5)
+_token_cache_lock = threading.Lock()
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+
+def _signing_key(token: str):
+    kid = jwt.get_unverified_header(token).get("kid")
+    with _token_cache_lock:
+        key = _signing_keys.get(kid)
+    if key is None:
+        key = JWKS_CLIENT.get_signing_key_from_jwt(token).key
+        with _token_cache_lock:
+            _signing_keys[kid] = key
+    return kid, key
+
+
+def verify_token(token: str):
+    """Verify Clerk JWT and return the full payload. Accept small clock skew."""
+    cache_key = _token_key(token)
+    with _token_cache_lock:
+        if cache_key in _rejected_tokens:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        payload = _verified_tokens.get(cache_key)
+        # A cached payload is only good until the token itself expires
+        if payload is not None:
+            if payload.get("exp", 0) + TOKEN_LEEWAY_SECONDS > time.time():
+                return payload
+            _verified_tokens.pop(cache_key, None)
+
+    kid = None
+    try:
+        kid, signing_key = _signing_key(token)
+        payload = jwt.decode(
+            token,
+            signing_key,
+            algorithms=["RS256"],
+            issuer=CLERK_ISSUER,
+            options={"verify_aud": False, "verify_iat": False},
+            leeway=TOKEN_LEEWAY_SECONDS
+        )
+    except jwt.InvalidTokenError as e:
+        # Bad signature, expired, wrong issuer... the token itself is at fault
+        print("❌ JWT verification failed:", e)
+        with _token_cache_lock:
+            _verified_tokens.pop(cache_key, None)
+            _rejected_tokens[cache_key] = True
+            if isinstance(e, jwt.InvalidSignatureError):
+                _signing_keys.pop(kid, None)
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except Exception as e:
+        # JWKS fetch problems and the like: don't hold them against the token
+        print("❌ JWT verification failed:", e)
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    print("✅ Token verified successfully:", {k: payload.get(k) for k in ("sub","email","email_address")})
+    with _token_cache_lock:
+        _verified_tokens[cache_key] = payload
+    return payload
+
+
+# Created once so every route shares it (and shows up as a security scheme in OpenAPI)
+security = HTTPBearer(auto_error=False)
+
+
+async def current_session(
+    request: Request,
+    creds: HTTPAuthorizationCredentials = Security(security),
+) -> dict:
+    """Dependency returning the verified Clerk payload for the request.
+
+    Reads `Authorization: Bearer <jwt>`; a `?token=` query parameter is still
+    accepted for pages the browser navigates to directly.
+    """
+    token = creds.credentials if creds else request.query_params.get("token")
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing token")
+    # verify_token may fetch the JWKS over HTTPS; keep that off the event loop
+    return await run_in_threadpool(verify_token, token)
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Awaitable, Callable, List
+
+from utils.log import get_logger
+
+logger = get_logger("flossy.batch_writer")
+
+_STOP = object()
+
+
+class BatchWriter:
+    """Queue rows and hand them to ``save`` in batches from a background task.
+
+    Each batch holds up to ``batch_max`` rows: whatever is already queued,
+    plus anything that arrives within ``flush_seconds`` of the first row.
+    Create one per job; ``close()`` saves what is still queued and stops the
+    task, and only affects this writer's own queue.
+    """
+
+    def __init__(
+        self,
+        save: Callable[[List], Awaitable[None]],
+        batch_max: int = 20,
+        flush_seconds: float = 0.1,
+    ):
+        self._save = save
+        self._batch_max = batch_max
+        self._flush_seconds = flush_seconds
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, row):
+        await self._queue.put(row)
+
+    async def close(self):
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is _STOP:
+                return
+
+            batch = [row]
+            deadline = loop.time() + self._flush_seconds
+            while len(batch) < self._batch_max:
+                try:
+                    row = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            try:
+                await self._save(batch)
+            except Exception as e:
+                logger.warning("⚠️ Could not save batch of %s rows: %s", len(batch), e)
@@ -0,0 +1,33 @@
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(name: str = "flossy") -> logging.Logger:
+    """Return a logger under "flossy" whose records are written off-thread.
+
+    Emitting only enqueues the record; a single QueueListener thread formats
+    it and writes to stderr, so async handlers never block on stream I/O.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            queue = SimpleQueue()
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            _listener = QueueListener(queue, handler)
+            _listener.start()
+            atexit.register(_listener.stop)
+
+            root = logging.getLogger("flossy")
+            root.addHandler(QueueHandler(queue))
+            root.setLevel(logging.INFO)
+            root.propagate = False
+    return logging.getLogger(name)
@@ -1,39 +1,101 @@
 import os
+import re
 import datetime
-import asyncio
+from typing import AsyncIterable
 from dotenv import load_dotenv
 from livekit import agents
 from livekit.agents import AgentSession, JobContext, WorkerOptions, cli
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
 from models import Patient, Interaction
 from livekit.plugins import elevenlabs, google
 from livekit.plugins.silero import VAD
+from utils.batch_writer import BatchWriter
+from utils.log import get_logger
 
 # Load environment variables
 load_dotenv()
 
+logger = get_logger("flossy.voice_agent")
+
 # --- ELEVENLABS CONFIG ---
 ELEVENLABS_API_KEY = os.getenv("ELEVEN_API_KEY")  # corrected key name
 VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "Rachel")  # use readable default
 
+# Loaded once per worker process and shared by every job, so a call doesn't
+# pay for the VAD model load or new Google clients on pickup
+_VAD = VAD.load()
+_STT = google.STT()
+_LLM = google.LLM()
+
+# --- INTERACTION LOG ---
+# Calls queue their Interaction rows on the job's BatchWriter, which inserts
+# whatever has piled up (up to INTERACTION_BATCH_MAX) in one statement.
+INTERACTION_BATCH_MAX = 64
+
+
+async def _save_interactions(batch: list):
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(Interaction), batch)
+        await db.commit()
+
+
+# Whitespace after ., ? or ! ends a sentence for TTS purposes
+SENTENCE_BREAK = re.compile(r"(?<=[.?!])\s+")
+
+
+async def _stream_reply(session: AgentSession, llm_stream: AsyncIterable[str]) -> str:
+    """Speak text chunks as complete sentences arrive, and return the full reply.
+
+    The sentences go to a single session.say() as an async iterator, so the
+    streaming TTS starts on the first one while the rest is still generated.
+    """
+    spoken = []
+
+    async def sentences():
+        buffer = ""
+        async for chunk in llm_stream:
+            buffer += chunk
+            *complete, buffer = SENTENCE_BREAK.split(buffer)
+            for sentence in complete:
+                if sentence.strip():
+                    spoken.append(sentence.strip())
+                    yield sentence.strip() + " "
+        if buffer.strip():
+            spoken.append(buffer.strip())
+            yield buffer.strip()
+
+    await session.say(sentences(), allow_interruptions=True)
+    return " ".join(spoken)
+
+
+async def _as_stream(text: str):
+    yield text
+
 
 class FlossyAgent(agents.Agent):
+    def __init__(self, *, interactions: BatchWriter, **kwargs):
+        super().__init__(**kwargs)
+        self._interactions = interactions
+
     async def on_start(self, session: AgentSession):
-        print("✅ FlossyAI started successfully — beginning call sequence.")
-        print("📞 FlossyAI is live and ready to make calls!")
+        logger.info("✅ FlossyAI started successfully — beginning call sequence.")
+        logger.info("📞 FlossyAI is live and ready to make calls!")
 
         # Fetch most recent patient
-        with SessionLocal() as db:
-            patient = db.query(Patient).order_by(Patient.contact_datetime.desc()).first()
+        async with AsyncSessionLocal() as db:
+            patient = await db.scalar(
+                select(Patient).order_by(Patient.contact_datetime.desc()).limit(1)
+            )
             if not patient:
-                print("⚠️ No patient found to call.")
+                logger.warning("⚠️ No patient found to call.")
                 return
 
-            print(f"📲 Calling {patient.name} at {patient.phone}")
+            logger.info("📲 Calling %s at %s", patient.name, patient.phone)
             await self.call_patient(session, db, patient)
 
-    async def call_patient(self, session: AgentSession, db: Session, patient: Patient):
+    async def call_patient(self, session: AgentSession, db: AsyncSession, patient: Patient):
         """Simulate a voice call with a patient."""
         message = (
             f"Hello {patient.name}, this is FlossyAI from your dental clinic. "
@@ -41,28 +103,32 @@ class FlossyAgent(agents.Agent):
             f"Are you experiencing any discomfort or pain?"
         )
 
-        # Log interaction in DB
-        interaction = Interaction(
-            patient_id=patient.id,
-            channel="voice",
-            message=message,
-            created_at=datetime.datetime.now(),
-        )
-        db.add(interaction)
-        db.commit()
+        # Log interaction in DB (written in batches by the job's BatchWriter)
+        await self._interactions.put({
+            "patient_id": patient.id,
+            "channel": "voice",
+            "message": message,
+            "created_at": datetime.datetime.now(),
+        })
 
-        print(f"🗣️ Speaking to {patient.name}...")
-        await session.say(message)
+        logger.info("🗣️ Speaking to %s...", patient.name)
+        await _stream_reply(session, _as_stream(message))
 
-        print(f"🗒️ Logged and completed simulated call to {patient.phone}")
+        logger.info("🗒️ Logged and completed simulated call to %s", patient.phone)
 
 
 # --- ENTRYPOINT ---
 async def entrypoint(ctx: JobContext):
     await ctx.connect()
 
-    # Configure ElevenLabs TTS
-    tts = elevenlabs.TTS()
+    # Per-job writer; closing it saves whatever is still queued
+    interactions = BatchWriter(_save_interactions, batch_max=INTERACTION_BATCH_MAX, flush_seconds=0)
+    interactions.start()
+    ctx.add_shutdown_callback(interactions.close)
+
+    # Configure ElevenLabs TTS: streamed synthesis, flushing small text chunks
+    # early so the first audio frame is out quickly
+    tts = elevenlabs.TTS(streaming_latency=1, chunk_length_schedule=[50, 90, 120])
     tts.voice = VOICE_ID  # set the chosen voice
 
     # Configure agent behavior
@@ -70,14 +136,15 @@ async def entrypoint(ctx: JobContext):
         instructions=(
             "You are FlossyAI, a friendly dental assistant who follows up with patients, "
             "helps with appointments, and checks their recovery in a caring tone."
-        )
+        ),
+        interactions=interactions,
     )
 
     # Create AgentSession (no 'agent' in constructor!)
     session = AgentSession(
-        vad=VAD.load(),
-        stt=google.STT(),
-        llm=google.LLM(),
+        vad=_VAD,
+        stt=_STT,
+        llm=_LLM,
         tts=tts,
     )
 